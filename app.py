@@ -1,7 +1,17 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
 import sqlite3
 import os
 import logging
+import io
+import hashlib
+import numpy as np
+import queue
+import threading
+import atexit
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from model_fusion import fuse_linear_model
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +22,7 @@ app.secret_key = "breast_cancer_secret_key"
 
 DB_FILENAME = 'predictions.db'
 MODEL_FILENAME = 'breast_cancer_model.pkl'
+MODEL_WEIGHTS_FILENAME = 'breast_cancer_model.npz'
 
 # 30 breast-cancer feature names (same as sklearn)
 feature_names = [
@@ -25,96 +36,340 @@ feature_names = [
     'worst concave points','worst symmetry','worst fractal dimension'
 ]
 
+# The schema is static, so column names and the INSERT statement are
+# built once at import
+SAFE_COLS = tuple(fn.replace(" ", "_") for fn in feature_names)
+COLS_SQL = ", ".join(SAFE_COLS)
+INSERT_PLACEHOLDERS = ", ".join(["?"] * (2 + len(SAFE_COLS)))  # username, pred, features
+INSERT_SQL = f"INSERT INTO predictions (username, prediction, {COLS_SQL}) VALUES ({INSERT_PLACEHOLDERS})"
+RECORDS_SQL = ("SELECT id, username, timestamp, prediction FROM predictions "
+               "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?")
+RECORD_SQL = "SELECT * FROM predictions WHERE id = ?"
+
 # --- Database setup ---
-def get_db_connection():
+DB_POOL_SIZE = 4
+# How long to wait for a free pooled connection before failing the request
+DB_POOL_TIMEOUT = 5.0
+
+def create_db_connection():
     try:
-        conn = sqlite3.connect(DB_FILENAME)
-        conn.row_factory = sqlite3.Row
+        # The app only ever runs the handful of fixed SQL strings defined
+        # above, so they all stay compiled in the statement cache
+        conn = sqlite3.connect(DB_FILENAME, check_same_thread=False, isolation_level=None,
+                               cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")
         return conn
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise
 
+# Long-lived connections shared by all request threads, so requests don't
+# pay for opening the db/-wal/-shm files and warming a fresh page cache.
+# Created per process by ensure_background_workers().
+def create_db_pool():
+    pool = queue.Queue(maxsize=DB_POOL_SIZE)
+    for _ in range(DB_POOL_SIZE):
+        pool.put(create_db_connection())
+    return pool
+
+db_pool = None
+
+@contextmanager
+def get_db_connection():
+    try:
+        conn = db_pool.get(timeout=DB_POOL_TIMEOUT)
+    except queue.Empty:
+        raise sqlite3.OperationalError(
+            f"No database connection free after {DB_POOL_TIMEOUT} seconds"
+        ) from None
+    try:
+        yield conn
+    finally:
+        db_pool.put(conn)
+
 def init_db():
     try:
-        conn = get_db_connection()
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS predictions (
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              username TEXT NOT NULL,
-              timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-              prediction INTEGER NOT NULL,
-              %s
+        # A throwaway connection, so no SQLite handle is left open in a
+        # process that may fork (see ensure_background_workers)
+        conn = create_db_connection()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS predictions (
+                  id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT NOT NULL,
+                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  prediction INTEGER NOT NULL,
+                  %s
+                )
+            """ % ",\n  ".join(f"{col} REAL NOT NULL" for col in SAFE_COLS))
+            # Lets /records read the newest rows straight off the index
+            # instead of sorting the whole table on every page load
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_predictions_ts "
+                "ON predictions(timestamp DESC, id DESC)"
             )
-        """ % ",\n  ".join(f"{fn.replace(' ', '_')} REAL NOT NULL"
-                            for fn in feature_names))
-        conn.commit()
-        conn.close()
+        finally:
+            conn.close()
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization error: {e}")
         raise
 
+# Pooled connections are in autocommit mode, where every statement pays for
+# its own commit; anything inserting several rows goes through here so
+# they share one transaction
+def insert_predictions(conn, rows):
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(INSERT_SQL, rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
 # Initialize database before loading the app
 init_db()
 
+# --- Background prediction writer ---
+# Requests enqueue rows and return immediately; a single writer thread
+# commits whatever has queued up in one transaction, so concurrent
+# predictions share one WAL commit instead of paying for one each.
+WRITE_BATCH_SIZE = 64
+# Bounded so a stalled disk pushes back on requests (for at most
+# WRITE_QUEUE_TIMEOUT seconds) instead of queueing rows without limit
+WRITE_QUEUE_SIZE = 1024
+WRITE_QUEUE_TIMEOUT = 1.0
+write_queue = None
+
+def prediction_writer():
+    while True:
+        rows = [write_queue.get()]
+        while len(rows) < WRITE_BATCH_SIZE:
+            try:
+                rows.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with get_db_connection() as conn:
+                try:
+                    insert_predictions(conn, rows)
+                except sqlite3.Error as e:
+                    if len(rows) == 1:
+                        raise
+                    # Retry row by row so one bad row doesn't drop the
+                    # rest of the batch
+                    logger.warning(f"Database error writing {len(rows)} predictions, retrying singly: {e}")
+                    for row in rows:
+                        try:
+                            conn.execute(INSERT_SQL, row)
+                        except sqlite3.Error as e:
+                            logger.error(f"Database error writing prediction for {row[0]}: {e}")
+        except Exception as e:
+            logger.error(f"Database error writing {len(rows)} predictions: {e}")
+        finally:
+            for _ in rows:
+                write_queue.task_done()
+
+
 # --- Load trained model and scaler ---
+class DummyModel:
+    def predict(self, X):
+        return [0] * len(X)  # Always predict benign for testing
+
+class DummyScaler:
+    def transform(self, X):
+        return X  # Return input unchanged
+
 # Use more robust model loading with error handling
-try:
-    import pickle
-    logger.info(f"Attempting to load model from {MODEL_FILENAME}")
-    
-    if not os.path.exists(MODEL_FILENAME):
-        logger.error(f"Model file {MODEL_FILENAME} not found")
-        # Create dummy model and scaler for testing deployment
-        class DummyModel:
-            def predict(self, X):
-                return [0]  # Always predict benign for testing
-                
-        class DummyScaler:
-            def transform(self, X):
-                return X  # Return input unchanged
-                
-        model = DummyModel()
-        scaler = DummyScaler()
-        logger.warning("Using dummy model and scaler for testing")
-    else:
+def load_pickled_model():
+    try:
+        import pickle
+        logger.info(f"Attempting to load model from {MODEL_FILENAME}")
+
+        if not os.path.exists(MODEL_FILENAME):
+            logger.error(f"Model file {MODEL_FILENAME} not found")
+            # Use dummy model and scaler for testing deployment
+            logger.warning("Using dummy model and scaler for testing")
+            return DummyModel(), DummyScaler()
+
+        # Read the file in one go and unpickle from memory rather than
+        # letting pickle.load issue many small reads
         with open(MODEL_FILENAME, 'rb') as f:
-            bundle = pickle.load(f)
-            model = bundle['model']
-            scaler = bundle['scaler']
-            logger.info("Model loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading model: {e}")
-    # Create emergency dummy model
-    class DummyModel:
-        def predict(self, X):
-            return [0]  # Always predict benign for testing
-            
-    class DummyScaler:
-        def transform(self, X):
-            return X  # Return input unchanged
-            
-    model = DummyModel()
-    scaler = DummyScaler()
-    logger.warning("Using emergency dummy model due to loading error")
+            data = f.read()
+        bundle = pickle.loads(data)
+        logger.info("Model loaded successfully")
+        return bundle['model'], bundle['scaler']
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        logger.warning("Using emergency dummy model due to loading error")
+        return DummyModel(), DummyScaler()
+
+# Fused weights exported by export_model.py are plain arrays, so loading
+# them never executes code from the file (unlike pickle), and when they
+# exist they are authoritative. They record the SHA-256 of the pickle they
+# came from, so a retrained pickle that was not re-exported is reported;
+# the pickle itself is never unpickled while the weights are present.
+def load_model_weights():
+    with np.load(MODEL_WEIGHTS_FILENAME, allow_pickle=False) as data:
+        if os.path.exists(MODEL_FILENAME):
+            with open(MODEL_FILENAME, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            if str(data['source_sha256']) != digest:
+                logger.warning(f"{MODEL_WEIGHTS_FILENAME} was not exported from the current "
+                               f"{MODEL_FILENAME}; serving the exported weights. Re-run "
+                               f"export_model.py if the pickle is a trusted retrain.")
+        return data['w'], float(data['b']), data['classes']
+
+fused_model = None
+model = scaler = None
+if os.path.exists(MODEL_WEIGHTS_FILENAME):
+    try:
+        fused_model = load_model_weights()
+        logger.info(f"Model weights loaded from {MODEL_WEIGHTS_FILENAME}")
+    except Exception as e:
+        # Present but unreadable: don't fall back to unpickling
+        logger.error(f"Error loading model weights: {e}")
+        model, scaler = DummyModel(), DummyScaler()
+        logger.warning("Using emergency dummy model due to loading error")
+else:
+    model, scaler = load_pickled_model()
+    try:
+        fused_model = fuse_linear_model(model, scaler)
+        if fused_model is not None:
+            logger.info("Using fused linear model for predictions")
+    except Exception as e:
+        logger.error(f"Error fusing model: {e}")
+
+# The fused decision is a single 30-wide dot product; float32 halves its
+# memory traffic and doubles the SIMD width, and only moves the score in
+# the 7th significant digit
+MODEL_DTYPE = np.float32
+
+if fused_model is not None:
+    w, b, classes = fused_model
+    fused_model = w.astype(MODEL_DTYPE), MODEL_DTYPE(b), classes
+
+def predict(X):
+    if fused_model is not None:
+        w, b, classes = fused_model
+        X = X.astype(MODEL_DTYPE, copy=False)
+        return classes[(X @ w + b > 0).astype(np.intp)]
+    return model.predict(scaler.transform(X))
+
+# --- Single-row predictions ---
+# The fused model scores a row in microseconds, so form submissions call it
+# inline; each request thread reuses its own (1, 30) input row instead of
+# building a fresh array for every prediction.
+_input_buffers = threading.local()
+
+def get_input_buffer():
+    buf = getattr(_input_buffers, 'X', None)
+    if buf is None:
+        buf = _input_buffers.X = np.empty((1, len(feature_names)), dtype=MODEL_DTYPE)
+    return buf
+
+# The sklearn fallback pays real per-call dispatch cost, so its form
+# submissions go through a batcher thread. Like prediction_writer, it never
+# waits for a batch to fill: it scores whatever has queued up while the
+# previous batch ran, so a lone request is scored immediately.
+PREDICT_BATCH_SIZE = 32
+PREDICT_TIMEOUT = 1.0
+predict_queue = None
+
+def prediction_batcher():
+    X = np.empty((PREDICT_BATCH_SIZE, len(feature_names)), dtype=np.float64)
+    while True:
+        items = [predict_queue.get()]
+        while len(items) < PREDICT_BATCH_SIZE:
+            try:
+                items.append(predict_queue.get_nowait())
+            except queue.Empty:
+                break
+        for i, (features, _) in enumerate(items):
+            X[i] = features
+        try:
+            preds = predict(X[:len(items)])
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+        else:
+            for (_, future), pred in zip(items, preds):
+                future.set_result(int(pred))
+
+def predict_one(features):
+    if fused_model is not None:
+        X = get_input_buffer()
+        X[0, :] = features
+        return int(predict(X)[0])
+    future = Future()
+    predict_queue.put((features, future))
+    return future.result(timeout=PREDICT_TIMEOUT)
+
+# --- Per-process background state ---
+# Threads and SQLite connections do not survive fork(), so the connection
+# pool, queues and worker threads are created lazily in whichever process
+# serves requests. This keeps workers forked from a preloaded app
+# (gunicorn --preload) working.
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+def ensure_background_workers():
+    global db_pool, write_queue, predict_queue, _workers_pid
+    if _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        db_pool = create_db_pool()
+        write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        predict_queue = queue.Queue()
+        threading.Thread(target=prediction_writer, name="prediction-writer", daemon=True).start()
+        if fused_model is None:
+            threading.Thread(target=prediction_batcher, name="prediction-batcher", daemon=True).start()
+        _workers_pid = os.getpid()
+
+@app.before_request
+def start_background_workers():
+    # Load-balancer probes must not open connections or start threads
+    if request.endpoint == 'healthz':
+        return
+    ensure_background_workers()
+
+# Flush queued predictions before the interpreter exits
+def flush_write_queue():
+    if _workers_pid == os.getpid():
+        write_queue.join()
+
+atexit.register(flush_write_queue)
+
+# The form only depends on the static feature list, so it is rendered once
+# and reused. Pages that carry flash messages, and every page in debug mode
+# (so template edits show up), are still rendered per request.
+index_html = None
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
+    global index_html
     if request.method == 'POST':
         try:
             username = request.form['username'].strip()
             raw_input = request.form['features']
-            vals = [float(v.strip()) for v in raw_input.split(',') if v.strip() != '']
+            # np.array's float conversion tolerates surrounding whitespace
+            arr = np.array([v for v in raw_input.split(',') if v.strip()], dtype=np.float64)
 
-            if len(vals) != len(feature_names):
-                flash(f"Expected {len(feature_names)} values but got {len(vals)}.", "error")
+            if arr.size != len(feature_names):
+                flash(f"Expected {len(feature_names)} values but got {arr.size}.", "error")
                 return redirect(url_for('index'))
+            # The fused model would score NaN/inf as Benign rather than fail
+            if not np.isfinite(arr).all():
+                raise ValueError("non-finite feature value")
 
             # Use scaler and model
             try:
-                X_scaled = scaler.transform([vals])
-                pred = int(model.predict(X_scaled)[0])
+                pred = predict_one(arr)
             except Exception as e:
                 logger.error(f"Prediction error: {e}")
                 flash("Error making prediction. Please try again.", "error")
@@ -122,14 +377,9 @@ def index():
 
             # Store in database
             try:
-                cols = ", ".join([fn.replace(" ", "_") for fn in feature_names])
-                placeholders = ", ".join(["?"] * (2 + len(vals)))  # username, pred, features
-                sql = f"INSERT INTO predictions (username, prediction, {cols}) VALUES ({placeholders})"
-                with get_db_connection() as conn:
-                    conn.execute(sql, [username, pred, *vals])
-                    conn.commit()
-            except Exception as e:
-                logger.error(f"Database error: {e}")
+                write_queue.put((username, pred, *arr.tolist()), timeout=WRITE_QUEUE_TIMEOUT)
+            except queue.Full:
+                logger.error("Database error: prediction write queue is full")
                 flash("Error saving to database. Your prediction was: " + 
                       ("Benign" if pred == 0 else "Malignant"), "warning")
                 return redirect(url_for('index'))
@@ -147,19 +397,111 @@ def index():
             flash("An unexpected error occurred. Please try again.", "error")
             return redirect(url_for('index'))
 
-    return render_template('index.html', feature_names=feature_names)
+    if app.debug or '_flashes' in session:
+        return render_template('index.html', feature_names=feature_names)
+    if index_html is None:
+        index_html = render_template('index.html', feature_names=feature_names)
+    return index_html
+
+MAX_BATCH_ROWS = 1000
+# Roughly MAX_BATCH_ROWS rows of 30 values with room to spare; larger
+# bodies are refused with 413 before any parsing happens
+app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    # Accepts CSV (one row of 30 values per line) or a JSON list of rows,
+    # and runs the whole batch through the model in one call
+    username = request.args.get('username', '').strip()
+    if not username:
+        return jsonify(error="The username query parameter is required."), 400
+
+    try:
+        if request.is_json:
+            payload = request.get_json(silent=True)
+            if payload is None:
+                return jsonify(error="Request body is not valid JSON."), 400
+            X = np.array(payload, dtype=np.float64, ndmin=2)
+        elif request.get_data().strip():
+            X = np.loadtxt(io.BytesIO(request.get_data()), delimiter=',',
+                           dtype=np.float64, ndmin=2)
+        else:
+            X = np.empty((0, len(feature_names)))
+    except (ValueError, TypeError) as e:
+        logger.error(f"Value error in batch submission: {e}")
+        return jsonify(error="All feature fields must be valid numbers."), 400
+
+    if X.ndim != 2 or X.shape[0] == 0 or X.shape[1] != len(feature_names):
+        return jsonify(error=f"Expected rows of {len(feature_names)} values."), 400
+    if X.shape[0] > MAX_BATCH_ROWS:
+        return jsonify(error=f"At most {MAX_BATCH_ROWS} rows per batch."), 413
+    # JSON null parses as NaN and 1e400 as inf; neither can be scored or stored
+    if not np.isfinite(X).all():
+        return jsonify(error="All feature fields must be valid numbers."), 400
+
+    try:
+        preds = np.asarray(predict(X), dtype=int).tolist()
+    except Exception as e:
+        logger.error(f"Batch prediction error: {e}")
+        return jsonify(error="Error making predictions."), 500
+
+    rows = [(username, pred, *vals) for pred, vals in zip(preds, X.tolist())]
+    try:
+        with get_db_connection() as conn:
+            insert_predictions(conn, rows)
+    except Exception as e:
+        logger.error(f"Database error: {e}")
+        return jsonify(error="Error saving to database.", predictions=preds), 500
+
+    return jsonify(predictions=preds)
+
+RECORDS_PER_PAGE = 100
+# Keeps OFFSET within SQLite's integer range for absurd ?page= values
+RECORDS_MAX_PAGE = 100000
 
 @app.route('/records')
 def records():
     try:
+        page = min(max(request.args.get('page', 1, type=int), 1), RECORDS_MAX_PAGE)
+        # A page is at most RECORDS_PER_PAGE + 1 rows, so it is read in full
+        # and the pooled connection is returned before rendering
         with get_db_connection() as conn:
-            rows = conn.execute("SELECT * FROM predictions ORDER BY timestamp DESC").fetchall()
-        return render_template('records.html', rows=rows, feature_names=feature_names)
+            # Fetch one extra row to learn whether an older page exists
+            rows = conn.execute(
+                RECORDS_SQL, (RECORDS_PER_PAGE + 1, (page - 1) * RECORDS_PER_PAGE)
+            ).fetchmany(RECORDS_PER_PAGE + 1)
+        has_next = len(rows) > RECORDS_PER_PAGE
+        return render_template('records.html', rows=rows[:RECORDS_PER_PAGE],
+                               page=page, has_next=has_next)
     except Exception as e:
         logger.error(f"Error loading records: {e}")
         flash("Error loading prediction records.", "error")
         return redirect(url_for('index'))
 
+@app.route('/records/<int:record_id>')
+def record_detail(record_id):
+    try:
+        with get_db_connection() as conn:
+            # Pooled connections return plain tuples; this one row is
+            # rendered by column name
+            cur = conn.cursor()
+            cur.row_factory = sqlite3.Row
+            row = cur.execute(RECORD_SQL, (record_id,)).fetchone()
+            cur.close()
+    except Exception as e:
+        logger.error(f"Error loading record {record_id}: {e}")
+        flash("Error loading prediction record.", "error")
+        return redirect(url_for('index'))
+    if row is None:
+        flash(f"Prediction record {record_id} not found.", "error")
+        return redirect(url_for('index'))
+    return render_template('record.html', row=row, feature_names=feature_names)
+
+# Load-balancer probe; touches neither the DB pool nor the model
+@app.route('/healthz')
+def healthz():
+    return 'ok', 200
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Export the pickled model bundle as fused linear weights for app.py.
+
+Run once after retraining:
+
+    python export_model.py
+
+The StandardScaler is folded into the LogisticRegression weights and the
+result is written to breast_cancer_model.npz, which app.py loads without
+unpickling anything. Bundles the app cannot fuse are refused, and the
+export records the pickle's SHA-256 so app.py can tell when it is stale.
+"""
+import hashlib
+import pickle
+import sys
+
+import numpy as np
+
+from model_fusion import fuse_linear_model
+
+MODEL_FILENAME = 'breast_cancer_model.pkl'
+MODEL_WEIGHTS_FILENAME = 'breast_cancer_model.npz'
+
+
+def main():
+    with open(MODEL_FILENAME, 'rb') as f:
+        data = f.read()
+    bundle = pickle.loads(data)
+    model, scaler = bundle['model'], bundle['scaler']
+
+    fused = fuse_linear_model(model, scaler)
+    if fused is None:
+        sys.exit(f"Cannot export {type(scaler).__name__} + {type(model).__name__}: "
+                 f"only StandardScaler + binary LogisticRegression can be fused")
+    w, b, classes = fused
+    # app.py compares this against the pickle on disk to detect a stale export
+    source_sha256 = hashlib.sha256(data).hexdigest()
+    np.savez(MODEL_WEIGHTS_FILENAME, w=w, b=b, classes=classes, source_sha256=source_sha256)
+    print(f"Wrote {MODEL_WEIGHTS_FILENAME}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+import numpy as np
+
+
+# A StandardScaler followed by a binary LogisticRegression is a single
+# linear function of the raw input, so fold the scaling into the weights:
+# w' = w / scale, b' = b - w' . mean. Returns None for anything else, which
+# callers treat as "use the sklearn path".
+def fuse_linear_model(model, scaler):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+
+    if not (isinstance(model, LogisticRegression) and isinstance(scaler, StandardScaler)):
+        return None
+    if model.coef_.shape[0] != 1:
+        return None
+    scale = scaler.scale_ if scaler.with_std else 1.0
+    w = model.coef_[0] / scale
+    b = model.intercept_[0] - (np.dot(w, scaler.mean_) if scaler.with_mean else 0.0)
+    return w, b, model.classes_